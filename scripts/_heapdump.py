@@ -0,0 +1,21 @@
+# Heapdump file name parsing shared by the experiment driver scripts.
+#
+# Heapdumps live in one directory per benchmark and are named like
+# heapdump.5.binpb.zst, where 5 is the GC number.
+import re
+from pathlib import Path
+from typing import Tuple, Union
+
+HEAPDUMP_RE = re.compile(r"^heapdump\.(\d+)\.binpb\.zst$")
+
+
+def parse(path: Union[str, Path]) -> Tuple[str, int]:
+    """
+    Returns (benchmark, GC number) of a heapdump path such as
+    ../heapdumps/sampled/fop/heapdump.5.binpb.zst.
+    """
+    p = Path(path)
+    m = HEAPDUMP_RE.match(p.name)
+    if m is None:
+        raise ValueError(f"Not a heapdump file name: {path}")
+    return p.parent.name, int(m.group(1))
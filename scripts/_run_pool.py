@@ -0,0 +1,138 @@
+# Bounded process pool shared by the experiment driver scripts.
+#
+# Scripts outside this directory import it after adding `scripts/` to
+# `sys.path`.
+import os
+import selectors
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+
+class Job(NamedTuple):
+    argv: List[str]
+    # stdout is streamed to `<output_path>.tmp`, which is renamed to this
+    # file only if the job succeeds. When None, stdout and stderr are
+    # spooled to temporary files and forwarded to ours in submission order,
+    # so the combined output matches a serial run.
+    output_path: Optional[str] = None
+    cwd: Optional[str] = None
+
+
+def run_pool(
+    jobs: List[Job],
+    max_workers: int,
+    env: Optional[Dict[str, str]] = None,
+    progress: bool = True,
+) -> int:
+    """
+    Run `jobs` with at most `max_workers` children alive at any time.
+    Returns the number of jobs that exited with a non-zero status.
+    """
+    total = len(jobs)
+    running = {}  # pid -> (index, proc, job, stdout file, stderr file)
+    pending = list(reversed(list(enumerate(jobs))))
+    # Spooled output of finished jobs waiting for earlier jobs to finish
+    finished = {}  # index -> (stdout file, stderr file, failure line)
+    next_to_forward = 0
+    done = 0
+    failed = 0
+    start_time = time.monotonic()
+    selector = selectors.DefaultSelector()
+
+    def print_progress():
+        if not progress:
+            return
+        elapsed = time.monotonic() - start_time
+        bar_len = 40
+        filled = int(bar_len * done / total) if total else bar_len
+        bar = "█" * filled + "░" * (bar_len - filled)
+        if done > 0:
+            eta_secs = elapsed / done * (total - done)
+            m, s = divmod(int(eta_secs), 60)
+            eta = f"{m}m{s:02d}s"
+        else:
+            eta = "..."
+        print(f"\r[{bar}] {done}/{total}  ETA {eta}  ", end="", flush=True)
+
+    print_progress()
+
+    while pending or running:
+        # Fill worker slots.
+        while pending and len(running) < max_workers:
+            index, job = pending.pop()
+            # Children write straight to files, so they never stall on a full
+            # pipe while we wait for another child.
+            if job.output_path is not None:
+                out = open(job.output_path + ".tmp", "wb")
+            else:
+                out = tempfile.TemporaryFile()
+            err = tempfile.TemporaryFile()
+            proc = subprocess.Popen(
+                job.argv,
+                stdout=out,
+                stderr=err,
+                env=env,
+                cwd=job.cwd,
+            )
+            running[proc.pid] = (index, proc, job, out, err)
+            selector.register(
+                os.pidfd_open(proc.pid), selectors.EVENT_READ, proc.pid
+            )
+
+        # Block until one of our children exits so its slot is refilled
+        # immediately. Waiting on pidfds rather than os.waitpid(-1) never
+        # reaps children the caller spawned outside the pool.
+        for key, _ in selector.select():
+            selector.unregister(key.fd)
+            os.close(key.fd)
+            index, proc, job, out, err = running.pop(key.data)
+            proc.wait()
+            failure = None
+            if proc.returncode != 0:
+                failed += 1
+                failure = f"FAILED ({proc.returncode}): {' '.join(job.argv)}"
+                if job.output_path is not None:
+                    print(f"\n{failure}")
+                    err.seek(0)
+                    stderr = err.read()
+                    if stderr:
+                        print(stderr.decode(errors="replace"))
+            if job.output_path is None:
+                # Reported along with the job's output, in submission order
+                finished[index] = (out, err, failure)
+            else:
+                out.close()
+                err.close()
+                # Never leave a truncated output behind
+                if proc.returncode == 0:
+                    os.replace(job.output_path + ".tmp", job.output_path)
+                else:
+                    os.unlink(job.output_path + ".tmp")
+                finished[index] = None
+            while next_to_forward in finished:
+                spooled = finished.pop(next_to_forward)
+                next_to_forward += 1
+                if spooled is None:
+                    continue
+                out, err, failure = spooled
+                if progress:
+                    print()
+                if failure is not None:
+                    print(failure, flush=True)
+                for f, dst in zip([out, err], [sys.stdout, sys.stderr]):
+                    dst.flush()
+                    f.seek(0)
+                    shutil.copyfileobj(f, dst.buffer)
+                    dst.buffer.flush()
+                    f.close()
+            done += 1
+            print_progress()
+
+    selector.close()
+    if progress:
+        print()  # Final newline after progress bar.
+    return failed
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import sys
 from pathlib import Path
+from io import StringIO
+
+import _heapdump
 
 # suites:
 #   heapdump:
@@ -13,12 +16,11 @@ from pathlib import Path
 
 heapdump_sampled = Path(sys.argv[1])
 
+out = StringIO()
 for bm in sorted(heapdump_sampled.glob("*")):
-    print("{}:".format(bm.stem))
-    print('  path: "/bin/true"')
-    print('  args: "', end="")
-    files = list(bm.glob("*"))
     # heapdump.3.binpb.zst
-    files.sort(key=lambda p: int(p.stem.split(".")[1]))
-    print(" ".join(map(str, files)), end = "")
-    print("\"")
\ No newline at end of file
+    files = sorted(bm.glob("*"), key=lambda p: _heapdump.parse(p)[1])
+    out.write(f"{bm.stem}:\n")
+    out.write('  path: "/bin/true"\n')
+    out.write(f'  args: "{" ".join(map(str, files))}"\n')
+sys.stdout.write(out.getvalue())
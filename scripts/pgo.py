@@ -3,86 +3,641 @@ import logging
 import tempfile
 import subprocess
 import os
-from typing import List, Optional
+from typing import Callable, Dict, List, NamedTuple, Optional
 import shutil
 from pathlib import Path
 import sys
 import argparse
+import contextlib
+import hashlib
+import json
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
 
 ROOT = Path(__file__).parent.parent.resolve()
 BUILDS = ROOT / "builds"
+# Profiles consumed by profile-use builds, see stash_profile
+PROFILES = BUILDS / "profiles"
+# AutoFDO maps samples back to source lines, so both the sampled and the
+# optimized binaries need line tables.
+AUTOFDO_RUSTFLAGS = "-Cdebuginfo=line-tables-only"
+# codegen-units=1 makes linking the long pole of each build, so use lld
+# where it is available.
+LINKER_RUSTFLAGS = (
+    "-Clink-arg=-fuse-ld=lld"
+    if sys.platform == "linux" and shutil.which("ld.lld")
+    else None
+)
+LLVM_PROFDATA = "/opt/rust/toolchains/nightly-x86_64-unknown-linux-gnu/lib/rustlib/x86_64-unknown-linux-gnu/bin/llvm-profdata"
 
 
-def cargo_wrapper(rustflags: Optional[str], dst: Optional[str]) -> Optional[str]:
-    cmd = ["cargo", "build", "--release"]
+class Profile(NamedTuple):
+    name: str
+    # Arguments of each training run
+    inputs: List[List[str]]
+    extra_rustflags: Optional[str] = None
+    # When set, build with only these cargo features instead of the defaults
+    features: Optional[List[str]] = None
+    # When set, the `<object_model>_<tracing_loop>` scenario of each input,
+    # whose profraws are then kept in a directory of their own for blending
+    scenarios: Optional[List[str]] = None
+
+
+# Cargo features that compile in a single object model or tracing loop
+OBJECT_MODEL_FEATURES = {
+    "OpenJDK": "om_openjdk",
+    "OpenJDKAE": "om_openjdk_ae",
+    "Bidirectional": "om_bidir",
+    "BidirectionalFallback": "om_bidir_fb",
+}
+TRACING_LOOP_FEATURES = {
+    "EdgeSlot": "tl_edge_slot",
+    "EdgeObjref": "tl_edge_objref",
+    "NodeObjref": "tl_node_objref",
+    "WPEdgeSlot": "tl_wp_edge_slot",
+}
+
+
+def build_key(rustflags: Optional[str], features: Optional[List[str]] = None) -> str:
+    # Besides the crate itself, build.rs links vendor/m5 and compiles the
+    # DRAMsim3 sources and configs from the sibling checkout.
+    dramsim3 = ROOT.parent / "DRAMsim3"
+    source_dirs = [ROOT / "src", ROOT / "vendor", dramsim3 / "src", dramsim3 / "configs"]
+    sources = sorted(p for d in source_dirs for p in d.rglob("*") if p.is_file())
+    sources += [
+        p for p in [ROOT / "Cargo.toml", ROOT / "Cargo.lock", ROOT / "build.rs"] if p.exists()
+    ]
+    h = hashlib.blake2b()
+    for p in sources:
+        h.update(str(p.relative_to(ROOT.parent)).encode())
+        h.update(p.read_bytes())
+    # A toolchain update changes the binary without touching any source
+    rustc = subprocess.run(["rustc", "-vV"], cwd=ROOT, stdout=subprocess.PIPE, check=True)
+    h.update(rustc.stdout)
+    h.update((rustflags or "").encode())
+    # A profile can be rewritten in place, so hash what the build consumes
+    for flag in (rustflags or "").split():
+        for prefix in ["-Cprofile-use=", "-Cprofile-sample-use="]:
+            if flag.startswith(prefix):
+                h.update(Path(flag[len(prefix):]).read_bytes())
+    if features is not None:
+        h.update(",".join(sorted(features)).encode())
+    return h.hexdigest()
+
+
+def cargo_wrapper(
+    rustflags: Optional[str],
+    dst: Optional[str],
+    target_dir: Optional[str] = None,
+    features: Optional[List[str]] = None,
+) -> Optional[str]:
+    # RUSTFLAGS would take precedence over the --config overlay below, so
+    # any inherited value is folded into it instead, for every build alike.
+    rustflags = " ".join(
+        f for f in [os.environ.get("RUSTFLAGS"), rustflags, LINKER_RUSTFLAGS] if f
+    ) or None
+    # Skip the build if dst was produced from the same sources and flags.
+    # Switching RUSTFLAGS forces cargo to rebuild everything, even when the
+    # resulting binary is already sitting in builds/.
+    if dst:
+        key = build_key(rustflags, features)
+        key_path = Path(dst + ".key")
+        if Path(dst).exists() and key_path.exists() and key_path.read_text() == key:
+            logging.info(f"{dst} is up to date, skipping build")
+            return dst
+    env = os.environ.copy()
+    # All builds, the baseline included, use the release-pgo profile so that
+    # they share its ThinLTO and codegen-units settings, and A/B comparisons
+    # isolate the effect of the profile.
+    profile = "release-pgo"
+    cmd = ["cargo", "build", "--bin", "hwgc_soft", "--profile", profile]
+    env.pop("RUSTFLAGS", None)
+    if rustflags:
+        cmd += ["--config", f"build.rustflags={json.dumps(rustflags.split())}"]
+    if features is not None:
+        cmd += ["--no-default-features", "--features", " ".join(features)]
     logging.info(
         "{}{}".format(
-            'RUSTFLAGS="' + rustflags + '" ' if rustflags else "", " ".join(cmd)
+            'CARGO_TARGET_DIR="' + target_dir + '" ' if target_dir else "",
+            " ".join(cmd),
         )
     )
-    env = os.environ.copy()
-    if rustflags:
-        env["RUSTFLAGS"] = rustflags
-    p = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if target_dir:
+        env["CARGO_TARGET_DIR"] = target_dir
+    # cargo reports progress and errors on stderr; stdout adds nothing
+    p = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
     if p.returncode != 0:
-        print(p.stdout)
         print(p.stderr)
         sys.exit(p.returncode)
-    logging.info("stdout: " + "\n".join(p.stdout.decode("utf-8").splitlines()[-5:]))
     logging.info("stderr: " + "\n".join(p.stderr.decode("utf-8").splitlines()[-5:]))
     if dst:
-        shutil.copy("./target/release/hwgc_soft", dst)
+        # copyfile uses copy_file_range/sendfile on Linux and skips the
+        # metadata copy, which matters for large binaries built with -g
+        shutil.copyfile(f"{target_dir or './target'}/{profile}/hwgc_soft", dst)
+        os.chmod(dst, 0o755)
+        Path(dst + ".key").write_text(key)
         return dst
 
 
+def profile_target_dir(profile_name: str) -> str:
+    # RUSTFLAGS is part of every unit's fingerprint, so builds with different
+    # flags sharing one target dir would rebuild the whole crate graph each
+    # time. A persistent target dir per profile keeps its artifacts warm
+    # across invocations.
+    return str(BUILDS / f"target-{profile_name}")
+
+
 def build_baseline(bin_name: str) -> str:
     return cargo_wrapper(None, str(BUILDS / bin_name))
 
 
-def build_profile_generate(pgo_dir: str, bin_name: str) -> str:
-    return cargo_wrapper(f"-Cprofile-generate={pgo_dir}", str(BUILDS / bin_name))
+def build_profile_generate(bin_name: str, features: Optional[List[str]] = None) -> str:
+    # Training runs set LLVM_PROFILE_FILE, so the binary does not need to
+    # embed the (per-invocation) temporary directory. Leaving it out keeps
+    # the build key stable so the binary can be reused across invocations.
+    return cargo_wrapper(
+        "-Cprofile-generate",
+        str(BUILDS / bin_name),
+        profile_target_dir(bin_name),
+        features,
+    )
 
 
-def build_pgo(
-    pgo_dir: str,
+def build_autofdo_train(bin_name: str, features: Optional[List[str]] = None) -> str:
+    return cargo_wrapper(
+        AUTOFDO_RUSTFLAGS, str(BUILDS / bin_name), profile_target_dir(bin_name), features
+    )
+
+
+def build_training_bins(
+    profiles: List[Profile], build: Callable[..., str], bin_name: str
+) -> Dict[str, str]:
+    """
+    Map each profile name to the binary that trains it. A profile only
+    matches code built with the same features, so specialized profiles get
+    a `<profile>_<bin_name>` training build of their own.
+    """
+    default_bin = build(bin_name)
+    logging.info(f"Training binary: {default_bin}")
+    return {
+        profile.name: (
+            default_bin
+            if profile.features is None
+            else build(f"{profile.name}_{bin_name}", profile.features)
+        )
+        for profile in profiles
+    }
+
+
+def profraw_dir(pgo_dir: str, profile_name: str, scenario: Optional[str] = None) -> Path:
+    # One directory per profile: a name-prefix glob would let `all_in_one`
+    # pick up the profraws of `all_in_one_debug`.
+    d = Path(pgo_dir) / profile_name
+    return d / scenario if scenario else d
+
+
+def clean_profraws(pgo_dir: str, profile_name: str):
+    d = profraw_dir(pgo_dir, profile_name)
+    d.mkdir(exist_ok=True)
+    for profraw in d.rglob("*.profraw"):
+        logging.info(f"Removing {profraw}")
+        os.remove(profraw)
+
+
+def run_training_cmd(cmd: List[str], env: Optional[Dict[str, str]] = None):
+    logging.info(f"\t{cmd}")
+    # Training runs matter only for the profiles they leave behind, so their
+    # (potentially large) stdout is discarded rather than buffered.
+    p = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        logging.error(p.stderr.decode("utf-8", errors="replace"))
+        p.check_returncode()
+
+
+def run_training(
     profile_gen_bin: str,
+    pgo_dir: str,
     profile_name: str,
-    inputs: List[List[str]],
-    extra_rustflags: Optional[str] = None,
+    args: List[str],
+    scenario: Optional[str] = None,
 ):
-    pgo = Path(pgo_dir)
-    for profraw in pgo.glob("*.profraw"):
-        logging.info(f"Removing {profraw}")
-        os.remove(profraw)
-    logging.info(f"Building profile: {profile_name}")
-    for i in inputs:
-        cmd = [profile_gen_bin]
-        cmd += i
-        logging.info(f"\t{cmd}")
-        stdout = subprocess.check_output(cmd)
-        logging.info(stdout)
-    profraws = list(pgo.glob("*.profraw"))
-    assert len(profraws) == 1
-    profdata = f"{pgo_dir}/{profile_name}.profdata"
+    cmd = [profile_gen_bin] + args
+    env = os.environ.copy()
+    d = profraw_dir(pgo_dir, profile_name, scenario)
+    d.mkdir(exist_ok=True)
+    # Each training process writes its own profraw, so concurrent runs of the
+    # same profile never clobber one another.
+    env["LLVM_PROFILE_FILE"] = f"{d}/{profile_name}_%p_%m.profraw"
+    run_training_cmd(cmd, env)
+
+
+def gather_profraws(
+    pgo_dir: str, profile_name: str, scenario: Optional[str] = None
+) -> List[Path]:
+    profraws = sorted(profraw_dir(pgo_dir, profile_name, scenario).rglob("*.profraw"))
+    assert profraws, f"No profraw produced for {profile_name} {scenario or ''}"
+    return profraws
+
+
+def merge_profraws(
+    pgo_dir: str,
+    profile_name: str,
+    training: List[Future],
+    scenario: Optional[str] = None,
+) -> str:
+    for future in training:
+        future.result()
+    profraws = gather_profraws(pgo_dir, profile_name, scenario)
+    profdata = f"{pgo_dir}/{profile_name}{'_' + scenario if scenario else ''}.profdata"
     cmd = [
-        "/opt/rust/toolchains/nightly-x86_64-unknown-linux-gnu/lib/rustlib/x86_64-unknown-linux-gnu/bin/llvm-profdata",
+        LLVM_PROFDATA,
         "merge",
+        "-sparse",
+        "-num-threads",
+        str(os.cpu_count()),
         "-o",
         profdata,
-        profraws[0],
-    ]
+    ] + [str(p) for p in profraws]
     logging.info(f"\t{cmd}")
     subprocess.check_output(cmd)
+    return profdata
+
+
+def stash_profile(profile_name: str, path: str) -> str:
+    """
+    Move the merged profile at `path` to `builds/profiles/<profile_name>/`,
+    named after its contents. Equal profiles thus get equal paths and keep
+    the profile's target dir warm, while a retrained profile still changes
+    the path: cargo never re-checks the dependency info of registry crates,
+    so they would otherwise keep the stale profile.
+    """
+    src = Path(path)
+    digest = hashlib.blake2b(src.read_bytes(), digest_size=16).hexdigest()
+    d = PROFILES / profile_name
+    d.mkdir(parents=True, exist_ok=True)
+    dst = d / f"{digest}{src.suffix}"
+    for old in d.iterdir():
+        if old != dst:
+            old.unlink()
+    shutil.move(src, dst)
+    return str(dst)
+
+
+def build_profile_use(
+    profile_name: str,
+    profdata: str,
+    extra_rustflags: Optional[str] = None,
+    features: Optional[List[str]] = None,
+):
+    profdata = stash_profile(profile_name, profdata)
     rustflags = f"-Cprofile-use={profdata}"
     if extra_rustflags:
         rustflags += f" {extra_rustflags}"
-    return cargo_wrapper(rustflags, str(BUILDS / profile_name))
+    return cargo_wrapper(
+        rustflags,
+        str(BUILDS / profile_name),
+        profile_target_dir(profile_name),
+        features,
+    )
+
+
+def run_bolt_training(instrumented_bin: str, args: List[str]):
+    cmd = [instrumented_bin] + args
+    run_training_cmd(cmd)
+
+
+def bolt_optimize(bin_path: str, work_dir: str, inputs: List[List[str]]) -> str:
+    """
+    Reorder the blocks and functions of `bin_path` with BOLT, using profiles
+    collected by running an instrumented copy over the same training inputs.
+    Returns the path of the `<bin>_bolt` binary.
+    """
+    name = Path(bin_path).name
+    fdata_dir = Path(work_dir) / f"{name}_fdata"
+    fdata_dir.mkdir(exist_ok=True)
+    instrumented = str(Path(work_dir) / f"{name}_bolt_inst")
+    cmd = [
+        "llvm-bolt",
+        bin_path,
+        "-instrument",
+        f"-instrumentation-file={fdata_dir}/{name}.fdata",
+        # Lets concurrent training runs write separate profiles
+        "-instrumentation-file-append-pid",
+        "-o",
+        instrumented,
+    ]
+    logging.info(f"\t{cmd}")
+    subprocess.check_output(cmd)
+
+    logging.info(f"Training BOLT profile: {name}")
+    max_workers = max(1, os.cpu_count() // 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in [pool.submit(run_bolt_training, instrumented, i) for i in inputs]:
+            future.result()
+
+    merged = Path(work_dir) / f"{name}_merged.fdata"
+    cmd = ["merge-fdata"] + [str(p) for p in sorted(fdata_dir.glob("*.fdata"))]
+    logging.info(f"\t{cmd}")
+    with open(merged, "wb") as f:
+        subprocess.run(cmd, stdout=f, check=True)
+
+    bolted = f"{bin_path}_bolt"
+    cmd = [
+        "llvm-bolt",
+        bin_path,
+        "-o",
+        bolted,
+        f"-data={merged}",
+        "-reorder-blocks=ext-tsp",
+        "-reorder-functions=hfsort+",
+        "-split-functions",
+        "-split-all-cold",
+        "-dyno-stats",
+    ]
+    logging.info(f"\t{cmd}")
+    subprocess.check_output(cmd)
+    return bolted
+
+
+def run_perf_record(train_bin: str, perf_data: str, args: List[str]):
+    cmd = [
+        "perf",
+        "record",
+        "-o",
+        perf_data,
+        "-e",
+        "br_inst_retired.near_taken:uppp",
+        "-b",
+        "--",
+        train_bin,
+    ] + args
+    run_training_cmd(cmd)
+
+
+def build_autofdo(
+    work_dir: str,
+    train_bins: Dict[str, str],
+    profiles: List[Profile],
+):
+    """
+    Sampling-based alternative to build_pgo. Training runs each profile's
+    uninstrumented binary in `train_bins` under `perf record -b`, so it costs
+    little more than a plain run. Each profile produces a `<profile>_autofdo`
+    binary.
+    """
+    max_workers = max(1, os.cpu_count() // 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for profile in profiles:
+            profile_name, inputs = profile.name, profile.inputs
+            extra_rustflags, features = profile.extra_rustflags, profile.features
+            train_bin = train_bins[profile_name]
+            logging.info(f"Sampling profile: {profile_name}")
+            perf_datas = [f"{work_dir}/{profile_name}_{i}.perf.data" for i in range(len(inputs))]
+            for future in [
+                pool.submit(run_perf_record, train_bin, perf_data, args)
+                for perf_data, args in zip(perf_datas, inputs)
+            ]:
+                future.result()
+
+            afdos = []
+            for perf_data in perf_datas:
+                afdo = perf_data.replace(".perf.data", ".afdo")
+                cmd = [
+                    "create_llvm_prof",
+                    f"--binary={train_bin}",
+                    f"--profile={perf_data}",
+                    f"--out={afdo}",
+                ]
+                logging.info(f"\t{cmd}")
+                subprocess.check_output(cmd)
+                afdos.append(afdo)
+            prof = f"{work_dir}/{profile_name}.afdo"
+            cmd = [LLVM_PROFDATA, "merge", "-sample", "-o", prof] + afdos
+            logging.info(f"\t{cmd}")
+            subprocess.check_output(cmd)
+
+            logging.info(f"Building profile: {profile_name}")
+            autofdo_name = f"{profile_name}_autofdo"
+            prof = stash_profile(autofdo_name, prof)
+            rustflags = f"{AUTOFDO_RUSTFLAGS} -Cprofile-sample-use={prof}"
+            if extra_rustflags:
+                rustflags += f" {extra_rustflags}"
+            cargo_wrapper(
+                rustflags,
+                str(BUILDS / autofdo_name),
+                profile_target_dir(autofdo_name),
+                features,
+            )
+
+
+def compile_profile(pgo_dir: str, profile: Profile, profdata: str, bolt: bool):
+    extra_rustflags = profile.extra_rustflags
+    logging.info(f"Building profile: {profile.name}")
+    if bolt:
+        # BOLT needs relocations to rewrite the binary
+        extra_rustflags = " ".join(
+            f for f in [extra_rustflags, "-Clink-arg=-Wl,--emit-relocs"] if f
+        )
+    bin_path = build_profile_use(profile.name, profdata, extra_rustflags, profile.features)
+    if bolt:
+        bolt_path = bolt_optimize(bin_path, pgo_dir, profile.inputs)
+        logging.info(f"BOLT binary: {bolt_path}")
+
+
+def build_pgo(
+    pgo_dir: str,
+    profile_gen_bins: Dict[str, str],
+    profiles: List[Profile],
+    bolt: bool = False,
+):
+    """
+    `profile_gen_bins` maps each profile name to the instrumented binary
+    that trains it, built with the same features as the profile.
+    With `bolt`, every PGO binary also gets a BOLT-optimized `<profile>_bolt`
+    variant trained on the same inputs.
+    Training, merging and compiling are pipelined across three pools:
+    training runs of all profiles share a bounded pool, each profile is
+    merged as soon as its own training finishes, and its profile-use build is
+    then queued on a single-worker compile pool. Training later profiles thus
+    fills the cores a compile leaves idle, such as during linking.
+    """
+    max_workers = max(1, os.cpu_count() // 2)
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="train_pool"
+    ) as train_pool, ThreadPoolExecutor(
+        max_workers=len(profiles), thread_name_prefix="merge_pool"
+    ) as merge_pool, ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="compile_pool"
+    ) as compile_pool:
+
+        def merge_then_compile(profile: Profile, training: List[Future]) -> Future:
+            profdata = merge_profraws(pgo_dir, profile.name, training)
+            return compile_pool.submit(compile_profile, pgo_dir, profile, profdata, bolt)
+
+        merges = []
+        for profile in profiles:
+            clean_profraws(pgo_dir, profile.name)
+            logging.info(f"Training profile: {profile.name}")
+            scenarios = profile.scenarios or [None] * len(profile.inputs)
+            training = [
+                train_pool.submit(
+                    run_training,
+                    profile_gen_bins[profile.name],
+                    pgo_dir,
+                    profile.name,
+                    i,
+                    scenario,
+                )
+                for i, scenario in zip(profile.inputs, scenarios)
+            ]
+            merges.append(merge_pool.submit(merge_then_compile, profile, training))
+        for merge in merges:
+            merge.result().result()
+
+
+def build_blended(
+    pgo_dir: str,
+    trained_profile: str,
+    weights: Dict[str, int],
+    profile_name: str = "blended",
+):
+    """
+    Blend the per-scenario profraws left behind by training `trained_profile`
+    with `llvm-profdata merge -weighted-input`, so the profile follows the
+    expected deployment mix instead of weighting every scenario uniformly.
+    Nothing is trained again.
+    """
+    weighted_inputs = []
+    for scenario, weight in weights.items():
+        profdata = merge_profraws(pgo_dir, trained_profile, [], scenario)
+        weighted_inputs.append(f"-weighted-input={weight},{profdata}")
+    profdata = f"{pgo_dir}/{profile_name}.profdata"
+    cmd = [LLVM_PROFDATA, "merge", "-sparse", "-o", profdata] + weighted_inputs
+    logging.info(f"\t{cmd}")
+    subprocess.check_output(cmd)
+    logging.info(f"Building profile: {profile_name}")
+    return build_profile_use(profile_name, profdata)
+
+
+def load_blend_weights(path: str, scenarios: List[str]) -> Dict[str, int]:
+    """
+    Read a YAML mapping from `<object_model>_<tracing_loop>` to a positive
+    integer weight. Scenarios left out of the file are left out of the blend.
+    """
+    import yaml
+
+    with open(path) as f:
+        weights = yaml.safe_load(f)
+    if not isinstance(weights, dict) or not weights:
+        raise ValueError(f"{path} must map at least one scenario to a weight")
+    for scenario, weight in weights.items():
+        if scenario not in scenarios:
+            raise ValueError(f"Unknown scenario {scenario}, expected one of {scenarios}")
+        # bool is a subclass of int, so `true` would otherwise pass as 1
+        if not isinstance(weight, int) or isinstance(weight, bool) or weight <= 0:
+            raise ValueError(f"Weight of {scenario} must be a positive integer, got {weight}")
+    return weights
+
+
+def sample_heapdumps(heapdumps: List[str], k: int, seed: int = 0) -> List[str]:
+    """
+    Pick `k` heapdumps per benchmark, where the benchmark is the name of the
+    directory holding the heapdump.
+    """
+    groups: Dict[str, List[str]] = {}
+    for h in heapdumps:
+        groups.setdefault(Path(h).parent.name, []).append(h)
+    rng = random.Random(seed)
+    sampled = []
+    for bm in sorted(groups):
+        sampled += rng.sample(groups[bm], min(k, len(groups[bm])))
+    return sampled
+
+
+def decompress_heapdumps(heapdumps: List[str], out_dir: str) -> List[str]:
+    """
+    Decompress each `*.binpb.zst` heapdump once into `out_dir`, so that the
+    many training runs over the same heapdumps skip zstd decoding.
+    Heapdumps keep their benchmark directory to avoid name clashes.
+    """
+    decoded = []
+    cmds = []
+    for h in heapdumps:
+        src = Path(h)
+        if src.suffix != ".zst":
+            decoded.append(h)
+            continue
+        dst = Path(out_dir) / src.parent.name / src.stem
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        cmds.append(["zstd", "-d", "-q", "-f", "-o", str(dst), str(src)])
+        decoded.append(str(dst))
+    max_workers = max(1, os.cpu_count() // 2)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for future in [pool.submit(subprocess.run, cmd, check=True) for cmd in cmds]:
+            future.result()
+    return decoded
+
+
+def positive_int(value: str) -> int:
+    k = int(value)
+    if k < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return k
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("heapdumps", metavar="heapdumps", type=str, nargs="+")
-    return parser.parse_args()
+    parser.add_argument(
+        "--bolt",
+        action="store_true",
+        help="Also produce BOLT-optimized <profile>_bolt binaries (needs llvm-bolt and merge-fdata in PATH)",
+    )
+    parser.add_argument(
+        "--subset-per-bench",
+        metavar="K",
+        type=positive_int,
+        help="Train on K randomly (but deterministically) chosen heapdumps per benchmark instead of all of them",
+    )
+    parser.add_argument(
+        "--autofdo",
+        action="store_true",
+        help="Use sampling-based AutoFDO instead of instrumentation (needs perf and create_llvm_prof in PATH)",
+    )
+    parser.add_argument(
+        "--specialize",
+        action="store_true",
+        help="Also build a <object_model>_<tracing_loop>_specialized binary per combination, with only that combination compiled in",
+    )
+    parser.add_argument(
+        "--blend-weights",
+        metavar="YAML",
+        help="Also build a `blended` binary whose profile mixes <object_model>_<tracing_loop> scenarios with the weights in this file",
+    )
+    parser.add_argument(
+        "--scratch-dir",
+        metavar="DIR",
+        default=str(BUILDS),
+        help="Where to decompress the heapdumps for training, which needs room for all of them uncompressed (default: builds/)",
+    )
+    args = parser.parse_args()
+    # Both only apply to instrumented PGO, which --autofdo replaces
+    if args.autofdo and args.bolt:
+        parser.error("--bolt cannot be combined with --autofdo")
+    if args.autofdo and args.blend_weights:
+        parser.error("--blend-weights cannot be combined with --autofdo")
+    # Validate the weights before hours of training rather than after
+    if args.blend_weights:
+        scenarios = [
+            f"{object_model}_{tracing_loop}"
+            for object_model in OBJECT_MODEL_FEATURES
+            for tracing_loop in TRACING_LOOP_FEATURES
+        ]
+        try:
+            args.blend_weights = load_blend_weights(args.blend_weights, scenarios)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    return args
 
 
 def main():
@@ -93,25 +648,31 @@ def main():
     args = parse_args()
     BUILDS.mkdir(exist_ok=True)
 
-    with tempfile.TemporaryDirectory(prefix="pgo_") as pgo_dir:
+    with contextlib.ExitStack() as stack:
+        pgo_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="pgo_"))
         logging.info("Temporary directory: {}".format(pgo_dir))
         baseline_path = build_baseline("baseline")
         logging.info(f"Baseline binary: {baseline_path}")
-        profile_gen_path = build_profile_generate(pgo_dir, "profile_generate")
-        logging.info(f"Profile gen binary: {profile_gen_path}")
 
         # Get possible args
         heapdumps: List[str]
         heapdumps = args.heapdumps
-        object_models = [
-            "OpenJDK",
-            "OpenJDKAE",
-            "Bidirectional",
-            "BidirectionalFallback",
-        ]
-        tracing_loops = ["EdgeSlot", "EdgeObjref", "NodeObjref", "WPEdgeSlot"]
+        if args.subset_per_bench is not None:
+            heapdumps = sample_heapdumps(heapdumps, args.subset_per_bench)
+            logging.info(f"Training heapdumps: {heapdumps}")
+        # Decoded heapdumps can be far larger than a tmpfs-backed /tmp
+        scratch_dir = stack.enter_context(
+            tempfile.TemporaryDirectory(prefix="heapdumps_", dir=args.scratch_dir)
+        )
+        heapdumps = decompress_heapdumps(heapdumps, scratch_dir)
+        object_models = list(OBJECT_MODEL_FEATURES)
+        tracing_loops = list(TRACING_LOOP_FEATURES)
 
-        ITERATIONS = "25"
+        # PGO needs coverage and relative frequencies, not stable timings, and
+        # counters are additive across iterations.
+        ITERATIONS = "1"
+
+        profiles: List[Profile] = []
 
         # # Individual PGO
         # for object_model in object_models:
@@ -121,7 +682,7 @@ def main():
         #             + heapdumps
         #         ]
         #         profile_name = f"{object_model}_{tracing_loop}".replace("-", "_")
-        #         build_pgo(pgo_dir, profile_gen_path, profile_name, inputs)
+        #         profiles.append(Profile(profile_name, inputs))
 
         # # Two object models
         # for tracing_loop in tracing_loops:
@@ -130,7 +691,7 @@ def main():
         #         ["-i", ITERATIONS, "-o", "OpenJDKAE", "-t", tracing_loop] + heapdumps,
         #     ]
         #     profile_name = f"OpenJDK_both_{tracing_loop}".replace("-", "_")
-        #     build_pgo(pgo_dir, profile_gen_path, profile_name, inputs)
+        #     profiles.append(Profile(profile_name, inputs))
         # for tracing_loop in tracing_loops:
         #     inputs = [
         #         ["-i", ITERATIONS, "-o", "Bidirectional", "-t", tracing_loop]
@@ -139,7 +700,7 @@ def main():
         #         + heapdumps,
         #     ]
         #     profile_name = f"Bidirectional_both_{tracing_loop}".replace("-", "_")
-        #     build_pgo(pgo_dir, profile_gen_path, profile_name, inputs)
+        #     profiles.append(Profile(profile_name, inputs))
 
         # # Two tracing loops
         # for object_model in object_models:
@@ -148,24 +709,50 @@ def main():
         #         ["-i", ITERATIONS, "-o", object_model, "-t", "EdgeSlot"] + heapdumps,
         #     ]
         #     profile_name = f"{object_model}_edge_both".replace("-", "_")
-        #     build_pgo(pgo_dir, profile_gen_path, profile_name, inputs)
+        #     profiles.append(Profile(profile_name, inputs))
 
         # All in one
         inputs = []
+        scenarios = []
         for object_model in object_models:
             for tracing_loop in tracing_loops:
                 inputs.append(
                     heapdumps + ["-o", object_model, "trace", "-i", ITERATIONS, "-t", tracing_loop]
                 )
+                scenarios.append(f"{object_model}_{tracing_loop}")
         profile_name = f"all_in_one"
-        build_pgo(pgo_dir, profile_gen_path, profile_name, inputs)
-        build_pgo(
-            pgo_dir,
-            profile_gen_path,
-            f"{profile_name}_debug",
-            inputs,
-            "-g",
-        )
+        profiles.append(Profile(profile_name, inputs, scenarios=scenarios))
+        profiles.append(Profile(f"{profile_name}_debug", inputs, "-g"))
+
+        # Specialized: one binary per combination, with only that object
+        # model and tracing loop compiled in, trained on its own inputs
+        if args.specialize:
+            for object_model in object_models:
+                for tracing_loop in tracing_loops:
+                    inputs = [
+                        heapdumps
+                        + ["-o", object_model, "trace", "-i", ITERATIONS, "-t", tracing_loop]
+                    ]
+                    profile_name = f"{object_model}_{tracing_loop}_specialized"
+                    features = [
+                        OBJECT_MODEL_FEATURES[object_model],
+                        TRACING_LOOP_FEATURES[tracing_loop],
+                    ]
+                    profiles.append(Profile(profile_name, inputs, features=features))
+
+        if args.autofdo:
+            train_bins = build_training_bins(profiles, build_autofdo_train, "autofdo_train")
+            build_autofdo(pgo_dir, train_bins, profiles)
+        else:
+            profile_gen_bins = build_training_bins(
+                profiles, build_profile_generate, "profile_generate"
+            )
+            build_pgo(pgo_dir, profile_gen_bins, profiles, args.bolt)
+
+            # Blended: the all_in_one scenarios mixed by the expected workload
+            if args.blend_weights:
+                blended_path = build_blended(pgo_dir, "all_in_one", args.blend_weights)
+                logging.info(f"Blended binary: {blended_path}")
 
 
 if __name__ == "__main__":
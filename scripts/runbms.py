@@ -8,6 +8,6 @@ import os
 ROOT = Path(__file__).parent.parent.resolve()
 BUILDS = ROOT / "builds"
 
-exe = BUILDS / sys.argv[1]
-cmd = "{} {}".format(exe, " ".join(sys.argv[3:]))
-os.system(cmd)
+exe = str(BUILDS / sys.argv[1])
+# Replace this process so no shell is spawned between the harness and the binary
+os.execvp(exe, [exe] + sys.argv[3:])
@@ -3,6 +3,9 @@ import sys
 from pathlib import Path
 import os
 
+import _heapdump
+from _run_pool import Job, run_pool
+
 # Argument will look like
 # ./scripts/runbms.py baseline /bin/true ../heapdumps/sampled/fop/heapdump.2.binpb.zst -o OpenJDK trace -t NodeObjref
 ROOT = Path(__file__).parent.parent.resolve()
@@ -18,8 +21,12 @@ for arg in sys.argv[3:]:
     else:
         rest_args.append(arg)
 
+jobs = []
 for bm in bms:
-    bm_name = str(Path(bm).parent.stem)
-    bm_idx = Path(bm).stem.split(".")[1]
-    cmd = "{} {} {} --trace-path {}.{}.json.gz".format(exe, bm, " ".join(rest_args), bm_name, bm_idx)
-    os.system(cmd)
+    bm_name, bm_idx = _heapdump.parse(bm)
+    cmd = [str(exe), bm, *rest_args, "--trace-path", f"{bm_name}.{bm_idx}.json.gz"]
+    jobs.append(Job(cmd))
+
+failed = run_pool(jobs, max(1, os.cpu_count() // 2), progress=False)
+if failed:
+    sys.exit(1)
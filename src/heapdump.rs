@@ -29,6 +29,11 @@ impl HeapDump {
         Ok(HeapDump::decode(buf.as_slice())?)
     }
 
+    fn from_binpb(p: impl AsRef<Path>) -> Result<HeapDump> {
+        let buf = std::fs::read(p)?;
+        Ok(HeapDump::decode(buf.as_slice())?)
+    }
+
     pub fn from_path(path: &str) -> Result<HeapDump> {
         let hd = if path.starts_with("[synthetic]") {
             match path.strip_prefix("[synthetic]") {
@@ -45,6 +50,9 @@ impl HeapDump {
                     return Err(anyhow::anyhow!("Invalid synthetic heapdump name: {}", path));
                 }
             }
+        } else if path.ends_with(".binpb") {
+            // Already decompressed, e.g., by scripts/pgo.py for training runs
+            HeapDump::from_binpb(path)?
         } else {
             HeapDump::from_binpb_zst(path)?
         };
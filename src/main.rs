@@ -59,13 +59,22 @@ pub fn main() -> Result<()> {
     );
     let args = Args::parse();
     match args.object_model {
+        #[cfg(feature = "om_openjdk")]
         ObjectModelChoice::OpenJDK => reified_main(OpenJDKObjectModel::<false>::new(), args),
+        #[cfg(feature = "om_openjdk_ae")]
         ObjectModelChoice::OpenJDKAE => reified_main(OpenJDKObjectModel::<true>::new(), args),
+        #[cfg(feature = "om_bidir")]
         ObjectModelChoice::Bidirectional => {
             reified_main(BidirectionalObjectModel::<true>::new(), args)
         }
+        #[cfg(feature = "om_bidir_fb")]
         ObjectModelChoice::BidirectionalFallback => {
             reified_main(BidirectionalObjectModel::<false>::new(), args)
         }
+        #[allow(unreachable_patterns)]
+        om => Err(anyhow::anyhow!(
+            "Object model {:?} is not enabled in this build",
+            om
+        )),
     }
 }
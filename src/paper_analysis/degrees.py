@@ -5,28 +5,52 @@ import sys
 import subprocess
 import os
 
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "scripts"))
+import _heapdump
+from _run_pool import Job, run_pool
+
 # Heapdumps are stored in sys.argv[1]
 # The heapdumps are group by benchmark names in folders, such as biojava
 # Each folder has heapdump in formats like heapdump.5.binpb.zst, where
 # 5 is the GC number
 
-# Iterate through all heapdumps and use subprocess to call
-# cargo run --release -- -o OpenJDK paper-analyze --analysis-name Degrees --output-path biojava.5.parquet
+# Build once, then iterate through all heapdumps and use a bounded process pool to call
+# ./target/release/hwgc_soft -o OpenJDK paper-analyze --analysis-name Degrees --output-path biojava.5.parquet
 
 heapdumps = Path(sys.argv[1])
+max_workers = max(1, os.cpu_count() // 2)
+env = {
+    "PROTOC": str(Path.home() / "protoc" / "bin" / "protoc"),
+    "PROTOC_INCLUDE": str(Path.home() / "protoc" / "include"),
+    **os.environ,
+}
+
+# Running the binary directly avoids a cargo workspace check per job, and
+# concurrent `cargo run` would serialize on the target dir lock.
+subprocess.run(["cargo", "build", "--release"], cwd=ROOT, env=env, check=True)
+exe = str(ROOT / "target" / "release" / "hwgc_soft")
+
+jobs = []
 for benchmark in heapdumps.iterdir():
     if benchmark.is_dir():
         for heapdump in benchmark.iterdir():
             if heapdump.suffix == ".zst":
-                gc_number = heapdump.stem.split(".")[-2]
+                _, gc_number = _heapdump.parse(heapdump)
                 output_path = f"{benchmark.name}.{gc_number}.parquet"
-                cmd = f"cargo run --release -- {heapdump} -o OpenJDK paper-analyze --analysis-name Degrees --output-path {output_path}"
+                argv = [
+                    exe,
+                    str(heapdump),
+                    "-o",
+                    "OpenJDK",
+                    "paper-analyze",
+                    "--analysis-name",
+                    "Degrees",
+                    "--output-path",
+                    output_path,
+                ]
+                jobs.append(Job(argv))
 
-                subprocess.run(
-                    cmd.split(),
-                    env={
-                        "PROTOC": str(Path.home() / "protoc" / "bin" / "protoc"),
-                        "PROTOC_INCLUDE": str(Path.home() / "protoc" / "include"),
-                        **os.environ,
-                    },
-                )
+failed = run_pool(jobs, max_workers, env)
+if failed:
+    sys.exit(1)
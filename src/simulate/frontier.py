@@ -4,24 +4,64 @@ from pathlib import Path
 import sys
 import subprocess
 import os
+import shutil
+import tempfile
 
-heapdumps = Path(sys.argv[1])
-for benchmark in heapdumps.iterdir():
-    if benchmark.is_dir():
-        for heapdump in benchmark.iterdir():
-            if heapdump.suffix == ".zst":
-                gc_number = heapdump.stem.split(".")[-2]
-                output_path = f"{benchmark.name}.{gc_number}.parquet"
-                cmd = f"cargo run --release -- {heapdump} -o OpenJDK simulate -p 32 -a IdealTraceUtilization"
-
-                subprocess.run(
-                    cmd.split(),
-                    env={
-                        "PROTOC": str(Path.home() / "protoc" / "bin" / "protoc"),
-                        "PROTOC_INCLUDE": str(Path.home() / "protoc" / "include"),
-                        **os.environ,
-                    },
-                )
-
-                # Rename ideal_trace_utilization_frontier.parquet into output_path
-                os.rename("ideal_trace_utilization_frontier.parquet", output_path)
\ No newline at end of file
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT / "scripts"))
+import _heapdump
+from _run_pool import Job, run_pool
+
+FRONTIER_PARQUET = "ideal_trace_utilization_frontier.parquet"
+
+heapdumps = Path(sys.argv[1]).resolve()
+max_workers = max(1, os.cpu_count() // 2)
+env = {
+    "PROTOC": str(Path.home() / "protoc" / "bin" / "protoc"),
+    "PROTOC_INCLUDE": str(Path.home() / "protoc" / "include"),
+    **os.environ,
+}
+
+# Build once up front so jobs can run the binary without going through cargo
+subprocess.run(["cargo", "build", "--release"], cwd=ROOT, env=env, check=True)
+exe = str(ROOT / "target" / "release" / "hwgc_soft")
+
+with tempfile.TemporaryDirectory(prefix="frontier_") as scratch:
+    jobs = []
+    outputs = []  # (job cwd, output_path)
+    for benchmark in heapdumps.iterdir():
+        if benchmark.is_dir():
+            for heapdump in benchmark.iterdir():
+                if heapdump.suffix == ".zst":
+                    _, gc_number = _heapdump.parse(heapdump)
+                    output_path = f"{benchmark.name}.{gc_number}.parquet"
+                    argv = [
+                        exe,
+                        str(heapdump),
+                        "-o",
+                        "OpenJDK",
+                        "simulate",
+                        "-p",
+                        "32",
+                        "-a",
+                        "IdealTraceUtilization",
+                    ]
+                    # The simulator always writes FRONTIER_PARQUET to its cwd,
+                    # so each job runs in its own directory.
+                    cwd = tempfile.mkdtemp(dir=scratch)
+                    jobs.append(Job(argv, cwd=cwd))
+                    outputs.append((cwd, output_path))
+
+    failed = run_pool(jobs, max_workers, env)
+
+    # Move each ideal_trace_utilization_frontier.parquet into output_path
+    for cwd, output_path in outputs:
+        frontier = Path(cwd) / FRONTIER_PARQUET
+        if frontier.exists():
+            shutil.move(str(frontier), output_path)
+        else:
+            print(f"No {FRONTIER_PARQUET} produced for {output_path}")
+            failed += 1
+
+if failed:
+    sys.exit(1)
@@ -24,6 +24,20 @@ pub enum TracingLoopChoice {
     ParEdgeSlot,
 }
 
+impl TracingLoopChoice {
+    /// Whether this tracing loop is compiled into the binary. Loops without
+    /// a `tl_*` feature are always available.
+    pub fn enabled(self) -> bool {
+        match self {
+            TracingLoopChoice::EdgeSlot => cfg!(feature = "tl_edge_slot"),
+            TracingLoopChoice::EdgeObjref => cfg!(feature = "tl_edge_objref"),
+            TracingLoopChoice::NodeObjref => cfg!(feature = "tl_node_objref"),
+            TracingLoopChoice::WPEdgeSlot => cfg!(feature = "tl_wp_edge_slot"),
+            _ => true,
+        }
+    }
+}
+
 #[derive(Debug, Default)]
 pub struct TracingStats {
     pub marked_objects: u64,
@@ -66,12 +80,16 @@ pub(crate) unsafe fn trace_object(o: u64, mark_sense: u8) -> bool {
 }
 
 mod distributed_node_objref;
+#[cfg(feature = "tl_edge_objref")]
 mod edge_objref;
+#[cfg(feature = "tl_edge_slot")]
 mod edge_slot;
+#[cfg(feature = "tl_node_objref")]
 mod node_objref;
 mod par_edge_slot;
 mod sanity;
 mod shape_cache;
+#[cfg(feature = "tl_wp_edge_slot")]
 mod wp_edge_slot;
 mod wp_edge_slot_dual;
 
@@ -83,6 +101,7 @@ use self::shape_cache::ShapeCacheStats;
 fn create_tracer<O: ObjectModel>(args: &TraceArgs) -> Option<Box<dyn Tracer<O>>> {
     // Only WPEdgeSlot supports the tracer interface for now.
     match args.tracing_loop {
+        #[cfg(feature = "tl_wp_edge_slot")]
         TracingLoopChoice::WPEdgeSlot => Some(wp_edge_slot::create_tracer::<O>(args)),
         TracingLoopChoice::WPEdgeSlotDual => Some(wp_edge_slot_dual::create_tracer::<O>(args)),
         TracingLoopChoice::ParEdgeSlot => Some(par_edge_slot::create_tracer::<O>(args)),
@@ -101,12 +120,15 @@ fn transitive_closure<O: ObjectModel>(
     let l = args.tracing_loop;
     let stats = unsafe {
         match l {
+            #[cfg(feature = "tl_edge_objref")]
             TracingLoopChoice::EdgeObjref => {
                 edge_objref::transitive_closure_edge_objref(mark_sense, object_model)
             }
+            #[cfg(feature = "tl_edge_slot")]
             TracingLoopChoice::EdgeSlot => {
                 edge_slot::transitive_closure_edge_slot(mark_sense, object_model)
             }
+            #[cfg(feature = "tl_node_objref")]
             TracingLoopChoice::NodeObjref => {
                 node_objref::transitive_closure_node_objref(mark_sense, object_model)
             }
@@ -131,6 +153,9 @@ fn transitive_closure<O: ObjectModel>(
                     unreachable!()
                 }
             }
+            // Rejected by reified_trace
+            #[allow(unreachable_patterns)]
+            _ => unreachable!(),
         }
     };
     let elapsed = start.elapsed();
@@ -159,6 +184,12 @@ pub fn reified_trace<O: ObjectModel>(mut object_model: O, args: Args) -> Result<
     if trace_args.tracing_loop == TracingLoopChoice::ShapeCache && trace_args.iterations != 1 {
         panic!("Only one iteration per heapdump is supported when doing shape cache analysis for avoiding warming up the shape cache");
     }
+    if !trace_args.tracing_loop.enabled() {
+        return Err(anyhow::anyhow!(
+            "Tracing loop {:?} is not enabled in this build",
+            trace_args.tracing_loop
+        ));
+    }
     let mut time = 0;
     let mut pauses = 0;
     let mut total_stats: TracingStats = Default::default();